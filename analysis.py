@@ -1,49 +1,280 @@
+import os
+import re
+import shutil
+import threading
+import functools
+from datetime import date
 import yfinance as yf
 import pandas as pd
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:  # optional accelerator; NumPy path below is always available
+    njit = None
+
+BENCHMARK = "SPY"
+RISK_FREE_RATE = 0.0426
+HISTORY_YEARS = 3  # longest window any analysis needs; shorter ones are slices of it
+CACHE_DIR = ".cache"
+
+# Ticker symbols become file names: anything else (separators, "..") is never cached
+SAFE_TICKER = re.compile(r"^(?!\.+$)[A-Za-z0-9.^=-]+$")
+
+def _day_dir(day):
+    return os.path.join(CACHE_DIR, "prices", f"{day:%Y%m%d}")
+
+def _cache_path(ticker, period, day, auto_adjust):
+    """Cache file for one ticker's history, or None if the symbol isn't safe as a file name."""
+    if not SAFE_TICKER.match(str(ticker)): return None
+    return os.path.join(_day_dir(day), f"{ticker}_{period}{'' if auto_adjust else '_raw'}.parquet")
+
+def _fetch_closes(tickers, period, day, auto_adjust=True):
+    """
+    Wide Close frame (dates x tickers). Each ticker's history is persisted under
+    .cache/prices/<day>/, so only the tickers not yet fetched today are downloaded, in one call.
+    Raises on empty data; tickers that fail to download are never cached.
+    """
+    frames, misses = [], []
+    for t in tickers:
+        path = _cache_path(t, period, day, auto_adjust)
+        if path and os.path.exists(path):
+            try:
+                frames.append(pd.read_parquet(path))
+                continue
+            except Exception:
+                # Unreadable file (truncated, or pyarrow missing): drop it and refetch the ticker
+                try: os.remove(path)
+                except OSError: pass
+        misses.append(t)
+
+    if misses:
+        data = yf.download(misses, period=period, auto_adjust=auto_adjust, group_by='column', threads=True, progress=False)['Close']
+        if isinstance(data, pd.Series): data = data.to_frame(name=misses[0])
+        frames.append(data)
+        try:
+            day_dir = _day_dir(day)
+            if not os.path.isdir(day_dir):
+                # First fetch of a new day: earlier days' files will never be read again
+                shutil.rmtree(os.path.dirname(day_dir), ignore_errors=True)
+                os.makedirs(day_dir, exist_ok=True)
+            for t in data.columns:
+                col = data[t].dropna()
+                path = _cache_path(t, period, day, auto_adjust)
+                if col.empty or path is None: continue
+                # Write beside the final path, then rename: readers only ever see whole files
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    col.to_frame(t).to_parquet(tmp, compression='zstd')
+                    os.replace(tmp, path)
+                except Exception:
+                    if os.path.exists(tmp): os.remove(tmp)
+                    raise
+        except Exception: pass  # cache is best-effort (read-only disk, no pyarrow, encoder errors)
+
+    closes = pd.concat(frames, axis=1).sort_index()
+    # A failed or rate-limited download comes back as all-NaN columns: that is no data either
+    if closes.empty or not closes.notna().to_numpy().any(): raise ValueError("No price data")
+    return closes[[t for t in tickers if t in closes.columns]]
+
+_PANELS = {}  # (universe, period, day) -> MarketPanel, complete panels only
+MAX_PANELS = 32
+
+def _load_panel(universe, period, day):
+    key = (universe, period, day)
+    panel = _PANELS.get(key)
+    if panel is None:
+        closes = _fetch_closes(universe, period, day)
+        panel = MarketPanel(closes)
+        # A ticker missing or all-NaN here failed to download: don't pin that for the day,
+        # so the next call retries it (tickers that did download come from the disk cache)
+        if closes.columns.size == len(universe) and closes.notna().any().all():
+            if len(_PANELS) >= MAX_PANELS: _PANELS.pop(next(iter(_PANELS)), None)
+            _PANELS[key] = panel
+    return panel
+
+def get_panel(tickers):
+    """
+    Master panel for `tickers`: holdings + benchmark at the longest horizon, downloaded once
+    and memoized per process (keyed by universe and day) so every analysis function shares it.
+    """
+    universe = tuple(sorted(set(tickers) | {BENCHMARK}))
+    return _load_panel(universe, f"{HISTORY_YEARS}y", date.today())
+
+def missing_history(tickers):
+    """Tickers (plus the benchmark) the shared panel has no usable price history for."""
+    wanted = list(dict.fromkeys([*tickers, BENCHMARK]))
+    try:
+        panel = get_panel(tickers)
+    except Exception: return wanted
+    have = set(panel.columns[np.isfinite(panel.prices).sum(axis=0) >= 2])
+    return [t for t in wanted if t not in have]
+
+def _pct_change(prices):
+    """Row-over-row simple returns of a (days x tickers) array, one row shorter than the input."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets = prices[1:] / prices[:-1]
+    rets -= 1
+    return rets
+
+def _max_drawdown_np(prices):
+    """Worst peak-to-trough drop per column of a (days x tickers) price array; NaNs are skipped."""
+    rolling_max = np.fmax.accumulate(prices, axis=0)
+    return np.fmin.reduce((prices - rolling_max) / rolling_max, axis=0)
+
+def _monthly_moments_np(rets):
+    """Count, mean and sample std per column of a monthly return array; NaNs skipped."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.isfinite(rets).sum(axis=0)
+        mean = np.nansum(rets, axis=0) / n
+        std = np.sqrt(np.nansum((rets - mean) ** 2, axis=0) / (n - 1))
+    return n, mean, std
+
+if njit is not None:
+    # Explicit signature: compiled (or loaded from numba's on-disk cache) at import time,
+    # so the first page render doesn't pay the JIT stall. Callers pass C-contiguous float32.
+    @njit("float64[:](float32[:, ::1])", cache=True)
+    def _max_drawdown(prices):
+        """Same as _max_drawdown_np, fused into one compiled pass per column (no cummax temporary)."""
+        n_days, n_tickers = prices.shape
+        out = np.empty(n_tickers)
+        for j in range(n_tickers):
+            peak = -np.inf
+            worst = 0.0
+            for i in range(n_days):
+                p = prices[i, j]
+                if p > peak: peak = p
+                dd = (p - peak) / peak
+                if dd < worst: worst = dd
+            out[j] = worst
+        return out
+
+    @njit("Tuple((int64[:], float64[:], float64[:]))(float32[:, ::1])", cache=True)
+    def _monthly_moments(rets):
+        """Same as _monthly_moments_np in one Welford pass per column (float64 accumulators)."""
+        n_rows, n_tickers = rets.shape
+        n = np.zeros(n_tickers, dtype=np.int64)
+        mean = np.full(n_tickers, np.nan)
+        std = np.full(n_tickers, np.nan)
+        for j in range(n_tickers):
+            count, mu, m2 = 0, 0.0, 0.0
+            for i in range(n_rows):
+                r = rets[i, j]
+                if np.isnan(r): continue
+                count += 1
+                delta = r - mu
+                mu += delta / count
+                m2 += delta * (r - mu)
+            n[j] = count
+            if count > 0: mean[j] = mu
+            if count > 1: std[j] = np.sqrt(m2 / (count - 1))
+        return n, mean, std
+else:
+    _max_drawdown = _max_drawdown_np
+    _monthly_moments = _monthly_moments_np
+
+class MarketPanel:
+    """
+    Wide Close history (dates x tickers) plus the arrays derived from it, computed on first
+    use and kept on the (memoized) panel so every function and rerun reuses them.
+    Everything on a panel is read-only.
+    """
+    def __init__(self, closes):
+        self.closes = closes
+        self._windows = {}
+
+    @property
+    def columns(self): return self.closes.columns
+
+    def window(self, years):
+        """Sub-panel for the last `years`, memoized so its derived arrays are shared too."""
+        if years >= HISTORY_YEARS: return self
+        if years not in self._windows:
+            cutoff = self.closes.index[-1] - pd.DateOffset(years=years)
+            self._windows[years] = MarketPanel(self.closes.loc[self.closes.index > cutoff])
+        return self._windows[years]
+
+    # float32 is plenty for ratio statistics and halves the bytes every reduction streams;
+    # callers widen results back to float64 when building output frames.
+    @functools.cached_property
+    def prices(self): return self.closes.to_numpy(dtype=np.float32)
+
+    @functools.cached_property
+    def filled(self): return self.closes.ffill().to_numpy(dtype=np.float32)
+
+    @functools.cached_property
+    def daily_rets(self): return _pct_change(self.filled)
+
+    @functools.cached_property
+    def monthly_rets(self):
+        # Month-end rows are derived once from the shared index and sliced for every ticker
+        # (same as resample('ME').last() on daily data, without the groupby machinery).
+        month_id = (self.closes.index.year * 12 + self.closes.index.month).to_numpy()
+        month_ends = np.flatnonzero(np.append(month_id[1:] != month_id[:-1], True))
+        return _pct_change(self.filled[month_ends])
+
+    @functools.cached_property
+    def max_drawdown(self): return _max_drawdown(np.ascontiguousarray(self.prices))
+
+    @functools.cached_property
+    def risk_stats(self): return _risk_stats(self)
+
+def _risk_stats(panel):
+    """
+    Sharpe, volatility, CAGR, max drawdown and beta for every column of `panel` in one fused
+    sweep (monthly 3Y methodology). Returns a dict of float64 arrays; 0.0 where data is short.
+    """
+    # Every statistic is a column reduction over the panel's (days x tickers) arrays, no
+    # per-ticker loop. Tickers that failed to download are all-NaN and fall out via `valid`.
+    cols = panel.columns
+    prices, monthly_rets = panel.prices, panel.monthly_rets
+    if BENCHMARK in cols: market_rets = monthly_rets[:, cols.get_loc(BENCHMARK)]
+    else: market_rets = np.full(len(monthly_rets), np.nan, dtype=np.float32)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_days = np.isfinite(prices).sum(axis=0)
+        n_months, avg_monthly_ret, std_dev_monthly = _monthly_moments(np.ascontiguousarray(monthly_rets))
+        annualized_return = avg_monthly_ret * 12
+        annualized_vol = std_dev_monthly * np.sqrt(12)
+
+        # Divide only where vol > 0; zero-vol and missing tickers keep the 0.0 from `out`
+        sharpe = np.divide(annualized_return - RISK_FREE_RATE, annualized_vol,
+                           out=np.zeros_like(annualized_vol), where=annualized_vol > 0)
+
+        max_drawdown = panel.max_drawdown
+
+        # Beta vs benchmark for all tickers at once: cross-moments are two GEMVs over the
+        # shared monthly index instead of one aligned np.cov per ticker.
+        has_mkt = np.isfinite(market_rets)
+        r, m = monthly_rets[has_mkt], market_rets[has_mkt]
+        present = np.isfinite(r)
+        r = np.where(present, r, 0.0)
+        n = present.sum(axis=0)
+        sum_m = present.T @ m
+        cov = r.T @ m - r.sum(axis=0) * sum_m / n
+        var_m = present.T @ (m * m) - sum_m ** 2 / n
+        beta = cov / var_m
+
+    valid = (n_days >= 500) & (n_months >= 24)
+    def clean(arr): return np.where(valid & np.isfinite(arr), arr, 0.0).astype(float)
+
+    return {
+        "sharpe": clean(sharpe), "volatility": clean(annualized_vol),
+        "cagr": clean(annualized_return), "max_drawdown": clean(max_drawdown),
+        "beta": clean(beta)
+    }
+
 def calculate_risk_metrics(df):
     """ (Keep Industry Standard 3Y Sharpe Code) """
     if df.empty or 'ticker' not in df.columns: return pd.DataFrame()
-    metrics = []
     tickers = df['ticker'].tolist()
     try:
-        data = yf.download(tickers, period="3y", group_by='ticker', auto_adjust=True, progress=False)
-    except: return pd.DataFrame()
+        panel = get_panel(tickers).window(3)
+    except Exception: return pd.DataFrame()
 
-    for t in tickers:
-        try:
-            if len(tickers) > 1: hist = data[t]['Close']
-            else: hist = data['Close']
-            hist = hist.dropna()
-            if len(hist) < 500: raise ValueError("Insufficient Data")
-
-            hist_monthly = hist.resample('ME').last().dropna()
-            monthly_rets = hist_monthly.pct_change().dropna()
-            if len(monthly_rets) < 24: raise ValueError("Insufficient Monthly Data")
-
-            avg_monthly_ret = monthly_rets.mean()
-            annualized_return = avg_monthly_ret * 12
-            std_dev_monthly = monthly_rets.std()
-            annualized_vol = std_dev_monthly * np.sqrt(12)
-            
-            rf_rate = 0.0426
-            if annualized_vol > 0:
-                sharpe = (annualized_return - rf_rate) / annualized_vol
-            else:
-                sharpe = 0.0
-
-            rolling_max = hist.cummax()
-            drawdown = (hist - rolling_max) / rolling_max
-            max_drawdown = drawdown.min()
-
-            metrics.append({
-                "ticker": t, "sharpe": float(sharpe), "volatility": float(annualized_vol),
-                "cagr": float(annualized_return), "max_drawdown": float(max_drawdown)
-            })
-        except:
-            metrics.append({"ticker": t, "sharpe": 0.0, "volatility": 0.0, "cagr": 0.0, "max_drawdown": 0.0})     
-    return pd.DataFrame(metrics)
+    # Every metric comes out of one sweep over the panel (memoized on it); just align here
+    metrics = pd.DataFrame(panel.risk_stats, index=panel.columns)
+    return metrics.reindex(tickers, fill_value=0.0).rename_axis('ticker').reset_index()
 
 def get_portfolio_history(df):
     """ (Keep History Code) """
@@ -51,21 +282,22 @@ def get_portfolio_history(df):
     tickers = df['ticker'].tolist()
     quantities = dict(zip(df['ticker'], df['quantity']))
     try:
-        data = yf.download(tickers, period="2y", auto_adjust=True, progress=False)['Close']
-        if isinstance(data, pd.Series): data = data.to_frame(name=tickers[0])
-        data = data.ffill().dropna()
-        portfolio_history = pd.Series(0.0, index=data.index)
-        for t in tickers:
-            if t in data.columns: portfolio_history += data[t] * quantities.get(t, 0)
-        return portfolio_history
-    except: return pd.Series()
+        panel = get_panel(tickers).window(2)
+        cols = [t for t in dict.fromkeys(tickers) if t in panel.columns]
+        prices = panel.filled[:, panel.columns.get_indexer(cols)]
+        rows = np.isfinite(prices).all(axis=1)  # same rows ffill().dropna() keeps
+        # One float32 matrix-vector product instead of N Series multiply-adds
+        qty_vec = np.array([quantities.get(t, 0.0) for t in cols], dtype=np.float32)
+        return pd.Series((prices[rows] @ qty_vec).astype(float), index=panel.closes.index[rows])
+    except Exception: return pd.Series()
 
 def get_correlation_matrix(df):
     """
     Fetches correlation data, CLUSTERED BY SECTOR.
     This groups similar industries together in the heatmap (e.g. all Tech together).
     """
-    if df.empty: return pd.DataFrame()
+    # A single asset has nothing to correlate with: skip the sort and the download
+    if df.empty or df['ticker'].nunique() < 2: return pd.DataFrame()
     
     # 1. Sort the DataFrame by Sector first, then Ticker
     if 'sector' in df.columns:
@@ -76,23 +308,66 @@ def get_correlation_matrix(df):
     sorted_tickers = sorted_df['ticker'].tolist()
     
     try:
-        data = yf.download(sorted_tickers, period="1y", auto_adjust=True, progress=False)['Close']
-        if len(sorted_tickers) == 1: return pd.DataFrame()
+        panel = get_panel(sorted_tickers).window(1)
         
         # Ensure we process columns in the SORTED order
         # Handle cases where some tickers might have failed download
-        available_cols = [t for t in sorted_tickers if t in data.columns]
-        data = data[available_cols]
-        
-        corr_matrix = data.pct_change().corr()
-        return corr_matrix
-    except:
+        available_cols = pd.Index([t for t in dict.fromkeys(sorted_tickers) if t in panel.columns])
+        R = panel.daily_rets[:, panel.columns.get_indexer(available_cols)]
+        if np.isnan(R).any():
+            # Ragged histories (e.g. recent IPOs) need pandas' pairwise-complete correlation
+            return pd.DataFrame(R, columns=available_cols).corr().astype(float)
+
+        # Complete panel: centered Gram matrix, then scale rows/cols in place
+        # (no outer(d, d) temporary)
+        R = R - R.mean(axis=0)
+        c = R.T @ R
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = np.sqrt(1.0 / np.diag(c))
+            c *= d
+            c *= d[:, None]
+        np.clip(c, -1.0, 1.0, out=c)
+        return pd.DataFrame(c.astype(float), index=available_cols, columns=available_cols)
+    except Exception:
         return pd.DataFrame()
 
+def get_tangency_weights(df):
+    """
+    Max-Sharpe (tangency) portfolio over the holdings, in closed form from 3Y monthly returns:
+    w = S^-1 (mu - rf) / 1'S^-1 (mu - rf). Unconstrained (negative = short).
+    Empty Series when there are too few usable assets or no tangency portfolio exists.
+    """
+    if df.empty or df['ticker'].nunique() < 2: return pd.Series(dtype=float)
+    tickers = list(dict.fromkeys(df['ticker']))
+    try:
+        panel = get_panel(tickers).window(3)
+    except Exception: return pd.Series(dtype=float)
+
+    # Same 24-month minimum as the risk metrics, then the months every kept asset traded
+    cols = pd.Index([t for t in tickers if t in panel.columns])
+    R = panel.monthly_rets[:, panel.columns.get_indexer(cols)].astype(float)
+    keep = np.isfinite(R).sum(axis=0) >= 24
+    cols, R = cols[keep], R[:, keep]
+    R = R[np.isfinite(R).all(axis=1)]
+    if len(cols) < 2 or len(R) < 2: return pd.Series(dtype=float)
+
+    excess = R.mean(axis=0) * 12 - RISK_FREE_RATE
+    cov = np.cov(R, rowvar=False) * 12
+    # pinv: with ~36 months the sample covariance can be singular for larger portfolios
+    raw = np.linalg.pinv(cov, hermitian=True) @ excess
+    total = raw.sum()
+    if not np.isfinite(total) or total <= 0: return pd.Series(dtype=float)
+    return pd.Series(raw / total, index=cols)
+
 def get_optimization_suggestions(df):
     """ (Keep Optimization Code) """
-    if df.empty or 'sharpe' not in df.columns: return pd.DataFrame(), pd.DataFrame()
-    avg_sharpe = df['sharpe'].mean()
-    to_trim = df[(df['sharpe'] < avg_sharpe) & (df['weight'] > 0.01)].sort_values('sharpe', ascending=True)
-    to_boost = df[df['sharpe'] > avg_sharpe].sort_values('sharpe', ascending=False)
+    # A lone holding is the average itself: nothing to trim or boost
+    if len(df) < 2 or 'sharpe' not in df.columns: return pd.DataFrame(), pd.DataFrame()
+    # Masks and argsorts on the raw arrays; each result is a single iloc take
+    sharpe, weight = df['sharpe'].to_numpy(dtype=float), df['weight'].to_numpy(dtype=float)
+    avg_sharpe = np.nanmean(sharpe)
+    trim_idx = np.flatnonzero((sharpe < avg_sharpe) & (weight > 0.01))
+    boost_idx = np.flatnonzero(sharpe > avg_sharpe)
+    to_trim = df.iloc[trim_idx[np.argsort(sharpe[trim_idx], kind='stable')]]
+    to_boost = df.iloc[boost_idx[np.argsort(-sharpe[boost_idx], kind='stable')]]
     return to_trim, to_boost
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import os
 from dotenv import load_dotenv
@@ -8,13 +9,96 @@ from dotenv import load_dotenv
 from ui import apply_custom_style, display_header, display_top_assets
 from extraction import extract_holdings_from_pdf, parse_manual_data, get_example_csv
 from processing import create_portfolio_df
-from analysis import calculate_risk_metrics, get_portfolio_history, get_correlation_matrix, get_optimization_suggestions
+from analysis import calculate_risk_metrics, get_portfolio_history, get_correlation_matrix, get_optimization_suggestions, get_tangency_weights, missing_history
 
 # --- CONFIG & STYLING ---
 st.set_page_config(page_title="Portfolio Analyst Pro", layout="wide", page_icon="📈")
 load_dotenv()
 apply_custom_style()
 
+# --- GEMINI CLIENT ---
+# One Gemini client (and its HTTP session) per key for the server's lifetime, not per rerun
+@st.cache_resource(show_spinner=False)
+def gemini_client(api_key):
+    from google import genai  # heavy import, only paid once a PDF is uploaded
+    return genai.Client(api_key=api_key)
+
+# --- CACHED PIPELINE ---
+# Streamlit reruns this script on every interaction; the market-data fetch and risk models
+# only depend on the holdings, so key them on a hashable snapshot of the raw list.
+def holdings_key(raw_holdings):
+    return tuple(tuple(sorted(h.items())) for h in raw_holdings)
+
+RATIO_COLUMNS = ['weight', 'sharpe', 'volatility', 'cagr', 'max_drawdown', 'beta']
+TOP_HOLDINGS = 25  # rows shown in the Overview table before 'Show all'
+
+class MarketDataError(Exception):
+    """Degraded market data: raised inside the cached steps so st.cache_data never stores it."""
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_portfolio(key):
+    df = create_portfolio_df([dict(h) for h in key])
+    # Quotes that fail to download come back as 0.0 and are filtered out, so an empty frame
+    # here is a failed (or rate-limited) fetch, not a result worth keeping for an hour
+    if df.empty: raise MarketDataError("No live prices came back for these holdings")
+    return df
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def analyze_portfolio(key):
+    df = load_portfolio(key)
+    # Every priced holding has history, so a ticker (or the benchmark) without any means its
+    # download failed: raise so the next run retries instead of caching zeroed metrics
+    missing = missing_history(df['ticker'].tolist())
+    if missing:
+        shown = ', '.join(missing[:5]) + (f" and {len(missing) - 5} more" if len(missing) > 5 else '')
+        raise MarketDataError(f"Price history is unavailable right now for {shown}")
+    risk_df = calculate_risk_metrics(df)
+    if risk_df.empty: raise MarketDataError("Price history is unavailable right now")
+    # Metrics come back one row per df ticker, in df's order (0.0 where missing): attach the
+    # columns positionally instead of a hash merge + fillna
+    metrics = risk_df.drop(columns='ticker')
+    final_df = pd.concat([df.reset_index(drop=True), metrics], axis=1)
+    # Ratios are only displayed to a few digits: float32 halves what every rerun serializes to
+    # Arrow. Money columns (quantity, price, value) stay float64 so cents survive large totals.
+    final_df = final_df.astype({c: np.float32 for c in RATIO_COLUMNS})
+    history_series = get_portfolio_history(final_df)
+    corr_matrix = get_correlation_matrix(final_df).astype(np.float32) # Now sorted by Sector
+    trim_df, boost_df = get_optimization_suggestions(final_df)
+    target = get_tangency_weights(final_df)
+    allocation_df = final_df[['ticker', 'sector', 'weight']].assign(target=final_df['ticker'].map(target))
+    allocation_df = allocation_df[allocation_df['target'].notna()]
+    return final_df, history_series, corr_matrix, trim_df, boost_df, allocation_df
+
+# Figures only change with the portfolio, so build each once and reuse it across reruns
+@st.cache_data(show_spinner=False)
+def correlation_figure(corr_matrix):
+    fig_corr = px.imshow(
+        corr_matrix, 
+        text_auto=".2f",
+        color_continuous_scale="RdBu_r",
+        zmin=-1, zmax=1,
+        aspect="auto"
+    )
+    fig_corr.update_layout(height=700) # Taller for readability
+    return fig_corr
+
+@st.cache_data(show_spinner=False)
+def sector_figure(sector_values):
+    sectors, values = zip(*sector_values) if sector_values else ((), ())
+    return px.pie(values=values, names=sectors, hole=0.5, color_discrete_sequence=px.colors.qualitative.Plotly)
+
+@st.cache_data(show_spinner=False)
+def history_figure(history_series):
+    hist_df = history_series.to_frame(name="Total Value")
+    fig_hist = px.area(hist_df, x=hist_df.index, y="Total Value")
+    fig_hist.update_layout(
+        xaxis_title="Date", yaxis_title="Value ($)",
+        hovermode="x unified", height=500,
+        yaxis=dict(tickformat="$,.0f"), showlegend=False
+    )
+    fig_hist.update_traces(line_color='#6366f1', fillcolor='rgba(99, 102, 241, 0.2)')
+    return fig_hist
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("⚙️ Data Source")
@@ -30,40 +114,74 @@ with st.sidebar:
 display_header()
 
 # 1. DATA INGESTION
-raw_holdings = []
+# The analysed portfolio is remembered as (source, key), where source is 'manual' or the PDF
+# upload's file_id. Switching mode or removing/replacing the file changes the source, so the
+# old portfolio is never shown as if it came from the new input.
+source, raw_holdings, submitted = None, [], False
 if manual_mode:
+    source = 'manual'
     with st.expander("📝 Data Entry (CSV)", expanded=False):
-        csv_input = st.text_area("Paste Holdings", value=get_example_csv(), height=150)
-        if st.button("🚀 Analyze Portfolio", type="primary"):
-            raw_holdings = parse_manual_data(csv_input)
+        # A form holds edits client-side: typing no longer reruns the script, only submitting does
+        with st.form("ingest", border=False):
+            csv_input = st.text_area("Paste Holdings", value=get_example_csv(), height=150)
+            if st.form_submit_button("🚀 Analyze Portfolio", type="primary"):
+                submitted = True
+                raw_holdings = parse_manual_data(csv_input)
 else:
     uploaded_file = st.file_uploader("Upload Robinhood PDF", type="pdf")
     if uploaded_file and api_key:
-        with st.spinner("✨ AI is reading your document..."):
-            raw_holdings = extract_holdings_from_pdf(uploaded_file, api_key=api_key)
-
-if raw_holdings:
-    # 2. PROCESS
-    # Note: This step now fetches Sectors, so it might take a few extra seconds
-    with st.spinner("Fetching Market Data & Sectors..."):
-        df = create_portfolio_df(raw_holdings)
-    
-    # 3. ANALYZE
-    with st.spinner("🔮 Crunching Industry Standard Risk Models..."):
-        risk_df = calculate_risk_metrics(df)
-        final_df = pd.merge(df, risk_df, on='ticker', how='left').fillna(0.0)
-        history_series = get_portfolio_history(final_df)
-        corr_matrix = get_correlation_matrix(final_df) # Now sorted by Sector
-        trim_df, boost_df = get_optimization_suggestions(final_df)
+        source = uploaded_file.file_id
+        # Extract once per upload: later reruns (view switches, toggles) reuse the stored key
+        # instead of re-reading the PDF. Empty results are never stored: a failed Gemini call
+        # also comes back as [], so the next rerun retries it.
+        analysed = st.session_state.get('analysed')
+        if not (analysed and analysed[0] == source):
+            submitted = True
+            with st.spinner("✨ AI is reading your document..."):
+                raw_holdings = extract_holdings_from_pdf(uploaded_file, client=gemini_client(api_key))
+
+# The Analyze submit is only True on the rerun it was clicked in, so the result is kept in
+# session state; a submit (or new upload) that yields nothing clears it instead of leaving
+# the previous portfolio on screen.
+if submitted:
+    if raw_holdings:
+        st.session_state['analysed'] = (source, holdings_key(raw_holdings))
+    else:
+        st.session_state.pop('analysed', None)
+        if manual_mode: st.error("⚠️ No holdings found. Paste CSV with 'ticker' and 'quantity' columns.")
+        else: st.error("⚠️ Couldn't read any holdings from this statement. Please try again.")
+analysed = st.session_state.get('analysed')
+if analysed and analysed[0] != source:
+    # Mode switched, or the PDF was removed/replaced: that portfolio no longer applies
+    del st.session_state['analysed']
+    analysed = None
+key = analysed[1] if analysed else None
+
+if key:
+    try:
+        # 2. PROCESS
+        # Note: This step now fetches Sectors, so it might take a few extra seconds
+        with st.spinner("Fetching Market Data & Sectors..."):
+            load_portfolio(key)
+
+        # 3. ANALYZE
+        with st.spinner("🔮 Crunching Industry Standard Risk Models..."):
+            final_df, history_series, corr_matrix, trim_df, boost_df, allocation_df = analyze_portfolio(key)
+    except MarketDataError as e:
+        # Nothing was cached: the next rerun (or Analyze click) fetches again
+        st.error(f"⚠️ {e}. Yahoo Finance may be rate-limiting; please try again in a moment.")
+        st.stop()
 
     # --- DASHBOARD ---
     
     # Top Level KPIs
     k1, k2, k3, k4 = st.columns(4)
-    weighted_sharpe = (final_df['weight'] * final_df['sharpe']).sum()
-    weighted_cagr = (final_df['weight'] * final_df['cagr']).sum()
-    total_val = final_df['value'].sum()
-    worst_dd = final_df['max_drawdown'].min()
+    # All KPI inputs pulled into one (n x 5) buffer; both weighted KPIs are a single
+    # weights @ (n x 2) product instead of two multiply+sum passes
+    kpi = final_df[['value', 'weight', 'sharpe', 'cagr', 'max_drawdown']].to_numpy(dtype=float)
+    total_val = kpi[:, 0].sum()
+    weighted_sharpe, weighted_cagr = kpi[:, 1] @ kpi[:, 2:4]
+    worst_dd = kpi[:, 4].min(initial=0.0)  # drawdowns are <= 0
 
     k1.metric("Total Value", f"${total_val:,.0f}")
     k2.metric("Portfolio Sharpe", f"{weighted_sharpe:.2f}", help="Target > 1.0")
@@ -73,9 +191,11 @@ if raw_holdings:
     st.markdown("---")
 
     # TABS
-    tab1, tab2, tab3, tab4 = st.tabs(["🚀 Sharpe Optimizer", "📊 Overview", "💰 Value History", "🔬 Deep Dive"])
+    # st.tabs runs every tab body on each rerun; a radio switch renders only the visible view
+    VIEWS = ["🚀 Sharpe Optimizer", "📊 Overview", "💰 Value History", "🔬 Deep Dive"]
+    view = st.radio("View", VIEWS, horizontal=True, label_visibility="collapsed", key="view")
 
-    with tab1:
+    if view == VIEWS[0]:
         st.subheader("Sharpe Maximization Engine")
         
         col_opt1, col_opt2 = st.columns(2)
@@ -106,23 +226,30 @@ if raw_holdings:
                 )
         
         st.markdown("---")
-        st.markdown("#### 3. Correlation Heatmap (Grouped by Industry)")
+        st.markdown("#### 3. Max-Sharpe Target Weights")
+        st.caption("Closed-form tangency portfolio from 3Y monthly returns. Unconstrained: negative weights are shorts.")
+        if not allocation_df.empty:
+            st.dataframe(
+                allocation_df,
+                column_config={
+                    "weight": st.column_config.NumberColumn("Current", format="percent"),
+                    "target": st.column_config.NumberColumn("Target", format="percent")
+                },
+                hide_index=True, use_container_width=True
+            )
+        else:
+            st.info("Not enough overlapping history to solve for a max-Sharpe allocation.")
+
+        st.markdown("---")
+        st.markdown("#### 4. Correlation Heatmap (Grouped by Industry)")
         st.caption("Assets are now clustered by Industry. Look for 'Blocks' of Red (Sector Risk).")
         
         if not corr_matrix.empty:
-            fig_corr = px.imshow(
-                corr_matrix, 
-                text_auto=".2f",
-                color_continuous_scale="RdBu_r",
-                zmin=-1, zmax=1,
-                aspect="auto"
-            )
-            fig_corr.update_layout(height=700) # Taller for readability
-            st.plotly_chart(fig_corr, use_container_width=True)
+            st.plotly_chart(correlation_figure(corr_matrix), use_container_width=True)
         else:
             st.warning("Need multiple assets to calculate correlation.")
 
-    with tab2:
+    if view == VIEWS[1]:
         st.caption("🏆 Top Positions")
         display_top_assets(final_df)
         st.markdown("<br>", unsafe_allow_html=True) 
@@ -130,8 +257,10 @@ if raw_holdings:
         c1, c2 = st.columns([2, 1])
         with c1:
             st.subheader("All Holdings")
+            # Large portfolios send only the biggest positions unless the full list is asked for
+            show_all = len(final_df) <= TOP_HOLDINGS or st.toggle(f"Show all {len(final_df)} holdings")
             st.dataframe(
-                final_df,
+                final_df if show_all else final_df.nlargest(TOP_HOLDINGS, 'weight'),
                 column_config={
                     "ticker": st.column_config.TextColumn("Asset"),
                     "sector": st.column_config.TextColumn("Industry"),
@@ -144,32 +273,27 @@ if raw_holdings:
         with c2:
             st.subheader("Sector Allocation")
             # Changed to Sector Pie Chart
-            fig = px.pie(final_df, values='value', names='sector', hole=0.5, color_discrete_sequence=px.colors.qualitative.Plotly)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(sector_figure(tuple(zip(final_df['sector'], final_df['value']))), use_container_width=True)
 
-    with tab3:
+    if view == VIEWS[2]:
         st.subheader("Portfolio Value Over Time (2 Years)")
         if not history_series.empty:
-            hist_df = history_series.to_frame(name="Total Value")
-            fig_hist = px.area(hist_df, x=hist_df.index, y="Total Value")
-            fig_hist.update_layout(
-                xaxis_title="Date", yaxis_title="Value ($)",
-                hovermode="x unified", height=500,
-                yaxis=dict(tickformat="$,.0f"), showlegend=False
-            )
-            fig_hist.update_traces(line_color='#6366f1', fillcolor='rgba(99, 102, 241, 0.2)')
-            st.plotly_chart(fig_hist, use_container_width=True)
+            st.plotly_chart(history_figure(history_series), use_container_width=True)
 
-    with tab4:
+    if view == VIEWS[3]:
         st.subheader("Risk Lab (Industry Standard)")
+        # Formatting is done client-side by column_config; no Styler pass on the server
+        by_sharpe = np.argsort(-final_df['sharpe'].to_numpy(), kind='stable')  # best first
         st.dataframe(
-            final_df[['ticker', 'sector', 'weight', 'cagr', 'volatility', 'max_drawdown', 'sharpe']]
-            .sort_values('sharpe', ascending=False)
-            .style.format({
-                "weight": "{:.1%}", "cagr": "{:.1%}", "volatility": "{:.1%}", 
-                "max_drawdown": "{:.1%}", "sharpe": "{:.2f}"
-            })
-            .background_gradient(subset=['sharpe'], cmap="RdYlGn")
-            .background_gradient(subset=['max_drawdown'], cmap="Reds_r"),
-            use_container_width=True
+            final_df[['ticker', 'sector', 'weight', 'cagr', 'volatility', 'max_drawdown', 'beta', 'sharpe']]
+            .iloc[by_sharpe],
+            column_config={
+                "weight": st.column_config.NumberColumn(format="percent"),
+                "cagr": st.column_config.NumberColumn(format="percent"),
+                "volatility": st.column_config.NumberColumn(format="percent"),
+                "max_drawdown": st.column_config.NumberColumn(format="percent"),
+                "beta": st.column_config.NumberColumn(format="%.2f"),
+                "sharpe": st.column_config.NumberColumn(format="%.2f")
+            },
+            hide_index=True, use_container_width=True
         )
\ No newline at end of file
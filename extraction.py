@@ -1,10 +1,36 @@
-import pdfplumber
 import pandas as pd
 import io
+import re
 import json
 import os
-from google import genai
-from google.genai import types
+import hashlib
+import functools
+import threading
+import weakref
+
+CACHE_DIR = os.path.join(".cache", "gemini")
+MAX_PROMPT_CHARS = 30000  # statement text sent to the model
+PROMPT = """
+Extract stock holdings from this text. Ignore cash/sweeps.
+Return ONLY valid JSON: {{ "holdings": [ {{"ticker": "STR", "quantity": 1.0}} ] }}
+TEXT: {text}
+"""
+
+@functools.lru_cache(maxsize=1)
+def _json_config():
+    """The request config never changes: build it once per process."""
+    from google.genai import types
+    return types.GenerateContentConfig(response_mime_type="application/json")
+
+# One lock per PDF digest: a second session (or a double click) uploading the same statement
+# waits for the first extraction and then reads its cached result instead of calling Gemini too.
+# Weak values: an entry lives only while some caller holds or waits on its lock.
+_digest_locks = weakref.WeakValueDictionary()
+_digest_locks_guard = threading.Lock()
+
+def _digest_lock(digest):
+    with _digest_locks_guard:
+        return _digest_locks.setdefault(digest, threading.Lock())
 
 def get_example_csv():
     return """ticker, quantity
@@ -50,29 +76,87 @@ def parse_manual_data(csv_text):
         df.rename(columns=rename_map, inplace=True)
         if 'ticker' not in df.columns or 'quantity' not in df.columns: return []
         return df[['ticker', 'quantity']].to_dict('records')
-    except: return []
+    except Exception: return []
+
+# Pages that are only boilerplate: disclosures, terms and notices. A page is dropped only when
+# it positively matches one of these AND carries no holdings header or position row, so an
+# unrecognised layout (continuation pages, odd row formats) is always sent rather than lost.
+DISCLOSURE_PAGE = re.compile(
+    r"Important (?:Information|Disclosures?)|Disclosures|Terms (?:and|&) Conditions|"
+    r"Privacy (?:Notice|Policy)|Customer Agreement|intentionally left blank", re.I)
+HOLDINGS_PAGE = re.compile(
+    r"Securities Held|Holdings|Positions|^[A-Z]{1,5}(?:\.[A-Z])?\b.*\$[\d,]+\.\d{2}", re.M)
+
+def _page_texts(pdf, limit):
+    """
+    Yields page texts until `limit` chars are collected; the prompt never sees more.
+    Pure disclosure/terms pages are skipped; if every page is skipped, those are yielded instead.
+    """
+    total, skipped = 0, []
+    for page in pdf.pages:
+        text = page.extract_text(layout=False)
+        page.close()  # drop the page's parsed objects before moving on
+        if not text: continue
+        # Statement tables are padded with runs of spaces; collapsing them cuts prompt tokens
+        text = re.sub(r"[ \t]+", " ", text) + "\n"
+        if DISCLOSURE_PAGE.search(text) and not HOLDINGS_PAGE.search(text):
+            if sum(map(len, skipped)) < limit: skipped.append(text)
+            continue
+        yield text
+        total += len(text)
+        if total >= limit: return
+    if not total: yield from skipped
+
+def _extract_holdings(file_obj, api_key, client, cache_path):
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f: return json.load(f)
+        except (OSError, ValueError):
+            # Unreadable or corrupt entry: drop it and extract again
+            try: os.remove(cache_path)
+            except OSError: pass
+
+    # Read straight from the upload buffer (no temp file); rewind in case a previous
+    # rerun left the position at the end
+    file_obj.seek(0)
+    # PDF and Gemini libraries are imported here, so manual-entry sessions never load them
+    import pdfplumber
+    from google import genai
+    with pdfplumber.open(file_obj) as pdf:
+        full_text = "".join(_page_texts(pdf, MAX_PROMPT_CHARS))
+    
+    if len(full_text) > 50 and (client or api_key):
+        client = client or genai.Client(api_key=api_key)
+        response = client.models.generate_content(
+            model="gemini-1.5-flash",
+            contents=PROMPT.format(text=full_text[:MAX_PROMPT_CHARS]),
+            config=_json_config()
+        )
+        data = json.loads(response.text)
+        holdings = data.get('holdings', [])
+        if holdings:
+            # Write beside the final path, then rename: readers only ever see whole files
+            tmp = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                with open(tmp, "w") as f: json.dump(holdings, f)
+                os.replace(tmp, cache_path)
+            except OSError:
+                try: os.remove(tmp)
+                except OSError: pass
+        return holdings
+    return []
 
-def extract_holdings_from_pdf(file_obj, api_key=None):
+def extract_holdings_from_pdf(file_obj, api_key=None, client=None):
+    """
+    PDF -> holdings list via Gemini. Results are cached on disk by the PDF's SHA-256.
+    Pass a long-lived `client` to reuse its HTTP session; otherwise one is built from `api_key`.
+    """
     try:
-        full_text = ""
-        with pdfplumber.open(file_obj) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text: full_text += text + "\n"
-        
-        if len(full_text) > 50 and api_key:
-            client = genai.Client(api_key=api_key)
-            prompt = f"""
-            Extract stock holdings from this text. Ignore cash/sweeps.
-            Return ONLY valid JSON: {{ "holdings": [ {{"ticker": "STR", "quantity": 1.0}} ] }}
-            TEXT: {full_text[:30000]}
-            """
-            response = client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(response_mime_type="application/json")
-            )
-            data = json.loads(response.text)
-            return data.get('holdings', [])
-    except: return []
-    return []
\ No newline at end of file
+        # Same statement bytes -> same holdings: skip the parse and the model call entirely
+        with file_obj.getbuffer() as buf:  # hash the upload in place, no bytes copy
+            digest = hashlib.sha256(buf).hexdigest()
+        cache_path = os.path.join(CACHE_DIR, digest + ".json")
+        with _digest_lock(digest):
+            return _extract_holdings(file_obj, api_key, client, cache_path)
+    except Exception: return []
\ No newline at end of file
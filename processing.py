@@ -1,5 +1,20 @@
 import pandas as pd
+import numpy as np
+import functools
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor
+
+@functools.lru_cache(maxsize=256)
+def _ticker(symbol):
+    # One Ticker per symbol for the whole process, so its .info is fetched once and reused
+    return yf.Ticker(symbol)
+
+def _lookup_sector(t):
+    try:
+        # accessing .info triggers the fetch
+        return _ticker(t).info.get('sector', 'Unknown')
+    except Exception:
+        return 'Unknown'
 
 def fetch_sector_map(tickers):
     """
@@ -10,63 +25,81 @@ def fetch_sector_map(tickers):
     if not tickers: return {}
     
     try:
-        # Using yf.Tickers is generally more efficient for bulk metadata
-        t_objs = yf.Tickers(" ".join(tickers))
-        
-        for t in tickers:
-            try:
-                # accessing .info triggers the fetch
-                sector = t_objs.tickers[t].info.get('sector', 'Unknown')
-                mapping[t] = sector
-            except:
-                mapping[t] = 'Unknown'
-    except:
+        # Each .info is its own HTTP round-trip, so overlap them on a thread pool
+        with ThreadPoolExecutor(max_workers=min(16, len(tickers))) as ex:
+            sectors = list(ex.map(_lookup_sector, tickers))
+        mapping = dict(zip(tickers, sectors))
+    except Exception:
         # Fallback if bulk fetch fails
         for t in tickers: mapping[t] = 'Unknown'
         
     return mapping
 
+def _last_closes(tickers, period):
+    """Latest Close per ticker (in `tickers` order) from one batched download; 0.0 where unavailable."""
+    try:
+        # Column layout: ['Close'] is always a (dates x tickers) frame, even for one ticker
+        data = yf.download(tickers, period=period, group_by='column', threads=True, progress=False)['Close']
+        if isinstance(data, pd.Series): data = data.to_frame(name=tickers[0])
+        # Last row aligned to the requested order in one reindex, read off the raw array rather
+        # than through a row Series; failed tickers come back NaN -> 0.0
+        return np.nan_to_num(data.reindex(columns=tickers).ffill().to_numpy(dtype=float)[-1])
+    except Exception:
+        return np.zeros(len(tickers))
+
 def create_portfolio_df(holdings_list):
     """Converts raw list -> Clean DataFrame with Prices, Values, Weights, AND SECTORS."""
     if not holdings_list:
         return pd.DataFrame()
 
-    df = pd.DataFrame(holdings_list)
-    
     # 1. Normalize
-    df.columns = [c.lower() for c in df.columns]
+    try:
+        # Records are {'ticker', 'quantity'}: build the two columns directly instead of
+        # letting pandas infer a frame from N dicts
+        df = pd.DataFrame({'ticker': [h['ticker'] for h in holdings_list],
+                           'quantity': [h['quantity'] for h in holdings_list]})
+    except (KeyError, TypeError):
+        df = pd.DataFrame(holdings_list)
+        df.columns = [c.lower() for c in df.columns]
     df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0.0)
+
+    # Merge duplicate lots of the same ticker (first-seen order): one unique + bincount pass
+    keys, first, inverse = np.unique(df['ticker'].astype(str).to_numpy(), return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    lots = np.bincount(inverse, weights=df['quantity'].to_numpy(dtype=float), minlength=len(keys))
+    df = pd.DataFrame({'ticker': keys[order], 'quantity': lots[order]})
     
     # 2. Fetch Live Prices
     tickers = df['ticker'].tolist()
     if not tickers: return df
 
-    try:
-        batch_data = yf.download(tickers, period="1d", group_by='ticker', progress=False)
-        current_prices = []
-        for t in tickers:
-            try:
-                if len(tickers) > 1: price = batch_data[t]['Close'].iloc[-1]
-                else: price = batch_data['Close'].iloc[-1]
-                current_prices.append(float(price))
-            except:
-                current_prices.append(0.0)
-    except:
-        current_prices = [0.0] * len(tickers)
+    # Sectors only need the symbols, so look them up in the background while the quotes
+    # download (zero-quantity lots are skipped up front; they can never have value)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        sectors = ex.submit(fetch_sector_map, df.loc[df['quantity'] > 0, 'ticker'].tolist())
 
-    df['price'] = current_prices
-    df['value'] = df['quantity'] * df['price']
-    
-    # 3. Filter and Weight
-    df = df[df['value'] > 0].copy()
-    total_value = df['value'].sum()
-    df['weight'] = df['value'] / total_value if total_value > 0 else 0.0
+        current_prices = _last_closes(tickers, "1d")
+        # Thinly traded or stale quotes can be absent from a 1-day window: retry only those,
+        # in one batched call over 5 days
+        missing = np.flatnonzero(current_prices == 0)
+        if missing.size:
+            current_prices[missing] = _last_closes([tickers[i] for i in missing], "5d")
+
+    # 3. Value, Filter and Weight: one array pass, and the frame is built once at the end
+    quantity = df['quantity'].to_numpy()
+    value = quantity * current_prices
+    keep = value > 0
+    value = value[keep]
+    total_value = value.sum()
+    df = pd.DataFrame({
+        'ticker': df['ticker'].to_numpy()[keep], 'quantity': quantity[keep],
+        'price': current_prices[keep], 'value': value,
+        'weight': value / total_value if total_value > 0 else 0.0
+    })
 
-    # 4. FETCH SECTORS (The New Addition)
-    # We do this after filtering to save API calls on zero-value assets
+    # 4. SECTORS (fetched alongside the prices above)
     if not df.empty:
-        valid_tickers = df['ticker'].tolist()
-        sector_map = fetch_sector_map(valid_tickers)
+        sector_map = sectors.result()
         df['sector'] = df['ticker'].map(sector_map).fillna('Unknown')
         
     return df
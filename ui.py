@@ -1,8 +1,16 @@
 import streamlit as st
+import numpy as np
+import re
+from html import escape
 
-def apply_custom_style():
-    """Injects modern CSS for shadows, rounded corners, and interactive elements."""
-    st.markdown("""
+def _minify(css):
+    """Drops comments and layout whitespace from a CSS block (runs once, at import)."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,])\s*", r"\1", css).strip()
+
+# Static page chrome: built once at import, every rerun just re-sends the same strings
+CUSTOM_CSS = _minify("""
         <style>
         /* 1. BACKGROUNDS */
         .main { background-color: #f8f9fa; }
@@ -39,7 +47,9 @@ def apply_custom_style():
         .header-card h1 { color: white !important; margin: 0; font-weight: 700; }
         .header-card p { color: #e0e7ff !important; margin-top: 0.5rem; font-size: 1.1rem; }
 
-        /* 5. ASSET CARDS */
+        /* 5. ASSET CARDS (one grid row; two per row on narrow screens) */
+        .asset-grid { display: grid; grid-template-columns: repeat(4, 1fr); gap: 1rem; }
+        @media (max-width: 640px) { .asset-grid { grid-template-columns: repeat(2, 1fr); } }
         .asset-card {
             background-color: white;
             padding: 20px;
@@ -52,27 +62,38 @@ def apply_custom_style():
         .asset-value { font-size: 1.5rem; font-weight: 600; color: #4338ca !important; }
         .asset-weight { font-size: 0.9rem; color: #6b7280 !important; background-color: #f3f4f6; padding: 4px 10px; border-radius: 20px; display: inline-block; margin-top: 8px; }
         </style>
-    """, unsafe_allow_html=True)
+    """)
 
-def display_header():
-    st.markdown("""
+HEADER_HTML = """
         <div class="header-card">
             <h1>Portfolio Analyst Pro</h1>
             <p>Advanced Risk Analytics & Sharpe Optimization</p>
         </div>
-    """, unsafe_allow_html=True)
+    """
+
+# One top-holding card; filled with (ticker, value, weight)
+ASSET_CARD = ('<div class="asset-card"><div class="asset-ticker">{}</div>'
+              '<div class="asset-value">${:,.0f}</div>'
+              '<div class="asset-weight">{:.1%} of Portfolio</div></div>')
+
+def apply_custom_style():
+    """Injects modern CSS for shadows, rounded corners, and interactive elements."""
+    st.html(CUSTOM_CSS)
+
+def display_header():
+    st.html(HEADER_HTML)
 
 def display_top_assets(df):
     """Renders the top 4 holdings as visual cards."""
-    if df.empty: return
-    top_assets = df.sort_values('weight', ascending=False).head(4)
-    cols = st.columns(4)
-    for idx, (index, row) in enumerate(top_assets.iterrows()):
-        with cols[idx]:
-            st.markdown(f"""
-            <div class="asset-card">
-                <div class="asset-ticker">{row['ticker']}</div>
-                <div class="asset-value">${row['value']:,.0f}</div>
-                <div class="asset-weight">{row['weight']:.1%} of Portfolio</div>
-            </div>
-            """, unsafe_allow_html=True)
\ No newline at end of file
+    if df.empty or not {'ticker', 'value', 'weight'}.issubset(df.columns): return
+    # Partial selection of the 4 largest weights, then order just those 4 (no full sort)
+    weights = df['weight'].to_numpy()
+    k = min(4, len(weights))
+    top = np.argpartition(-weights, k - 1)[:k]
+    top_assets = df.iloc[top[np.argsort(-weights[top], kind='stable')]]
+    # Tickers come from user CSV / model output: escape them before they go into raw HTML
+    cards = [ASSET_CARD.format(escape(str(ticker)), value, weight) for ticker, value, weight in
+             top_assets[['ticker', 'value', 'weight']].itertuples(index=False, name=None)]
+    # One grid element holding every card: a single message to the browser instead of
+    # four column containers with a markdown block each
+    st.html('<div class="asset-grid">' + "".join(cards) + '</div>')